@@ -1,64 +1,150 @@
-import os
+import math
+
+import numpy as np
 import pandas as pd
 import psycopg2
+import psycopg2.extras
 import streamlit as st
 
-def get_conn():
-    db = os.environ.get("DATABASE_URL") or st.secrets.get("DATABASE_URL")
-    if not db:
-        st.error("DATABASE_URL not set. Add it to .streamlit/secrets.toml or Streamlit Cloud Secrets.")
-        st.stop()
-    return psycopg2.connect(db)
+from lib.lib_db import get_conn, df_from_sql, execute_prepared  # get_conn is pooled; use as `with get_conn() as conn:`
 
-def load_area_df(conn, area_name: str) -> pd.DataFrame:
+def run_values(conn, sql: str, rows, template=None) -> int:
+    """Send all rows through one `values %s` statement, in one transaction; returns rows affected."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    with conn, conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, sql, rows, template=template, page_size=len(rows))
+        return cur.rowcount
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_area_df(area_name: str) -> pd.DataFrame:
+    """Area items with on-hand; cached so widget reruns don't re-query. Clear after writes."""
     q = """
-    with onhand as (
-      select ingredient_id, sum(case when type='in' then qty else -qty end) as on_hand
-      from inventory_txns group by ingredient_id
-    )
-    select i.id as ingredient_id, i.name, i.unit, i.area, i.vendor,
+    select i.id as ingredient_id, i.name, i.unit, i.area, i.vendor, i.short_code,
            coalesce(o.on_hand,0) as on_hand
     from ingredients i
-    left join onhand o on o.ingredient_id = i.id
+    left join ingredient_on_hand o on o.ingredient_id = i.id
     where i.area = %s
     order by i.name;
     """
-    return pd.read_sql(q, conn, params=(area_name,))
-
-def save_count_adjustments(conn, base_map, new_map):
-    diffs = []
-    for rid, new_val in new_map.items():
-        base_val = float(base_map.get(rid, 0.0))
-        if abs(new_val - base_val) > 1e-9:
-            diffs.append((rid, new_val))
+    with get_conn() as conn:
+        df = df_from_sql(conn, q, (area_name,), dtype={"on_hand": "float64"})
+    # Lower-cased search columns, computed once per load instead of on every keystroke
+    df["_name_lc"] = df["name"].str.lower()
+    df["_code_lc"] = df["short_code"].fillna("").str.lower()
+    return df
+
+def save_count_adjustments(conn, diffs):
+    """Post (ingredient_id, new_on_hand) pairs as adjustment transactions; returns rows inserted."""
     if not diffs:
         return 0
+    rids, new_vals = (list(col) for col in zip(*diffs))
+    # Prepared once per pooled connection, so each save is just bind + execute
+    with conn:
+        rows, _ = execute_prepared(conn, "save_counts", (rids, new_vals))
+    return rows[0][0]
+
+@st.fragment(run_every="30s")
+def _clock():
+    """Header clock; reruns on its own every 30s to stay current."""
+    from datetime import datetime
 
-    with conn, conn.cursor() as cur:
-        for rid, new_val in diffs:
-            cur.execute("""
-                with current as (
-                  select coalesce(sum(case when type='in' then qty else -qty end),0) as on_hand
-                  from inventory_txns where ingredient_id = %s
-                )
-                insert into inventory_txns (ingredient_id, type, qty, source)
-                select %s,
-                       case when %s >= on_hand then 'in' else 'out' end,
-                       abs(%s - on_hand),
-                       'adjustment'
-                from current
-                where %s <> on_hand;
-            """, (rid, rid, new_val, new_val, new_val))
-    return len(diffs)
+    st.metric("Time", datetime.now().strftime("%-I:%M %p"))
+
+def _refresh_count_view(area_name: str) -> None:
+    """Drop the grid snapshot after counts change outside the grid; the new key starts a fresh editor."""
+    st.session_state.pop(f"count_view_{area_name}", None)
+    st.session_state[f"count_ver_{area_name}"] = st.session_state.get(f"count_ver_{area_name}", 0) + 1
+
+def _go_to_page(page_key: str, page: int) -> None:
+    st.session_state[page_key] = page
+
+def _reset_counts(area_name, counts_arr, base_arr) -> None:
+    counts_arr[:] = base_arr
+    _refresh_count_view(area_name)
+
+@st.fragment
+def _count_grid(area_name, df, filtered, search, counts_arr, base_arr):
+    """Count grid, review and save; edits and paging rerun only this fragment, not the load/search/sidebar."""
+    # One page of the filtered items in an editable grid. The editor gets the same snapshot until
+    # the search, page or counts change outside it, so its widget state survives reruns; edits fold
+    # into counts_arr by row position, so they survive page changes.
+    page_size = 30
+    n_pages = max(1, math.ceil(len(filtered) / page_size))
+    view_key, page_key = f"count_view_{area_name}", f"page_{area_name}"
+    view = st.session_state.get(view_key)
+    if view is not None and view[0][0] != search:
+        st.session_state[page_key] = 0
+    page = min(st.session_state.get(page_key, 0), n_pages - 1)
+    if view is None or view[0] != (search, page):
+        rows = filtered.iloc[page*page_size : (page+1)*page_size]
+        view = ((search, page), rows[["ingredient_id","name","unit","vendor","on_hand"]]
+                .assign(count=counts_arr[rows.index.to_numpy()]))
+        st.session_state[view_key] = view
+    edited = st.data_editor(
+        view[1],
+        key=f"editor_{area_name}_{st.session_state.get(f'count_ver_{area_name}', 0)}",
+        use_container_width=True,
+        hide_index=True,
+        disabled=["ingredient_id","name","unit","vendor","on_hand"],
+        column_config={
+            "ingredient_id": None,
+            "name": st.column_config.TextColumn("Item"),
+            "unit": st.column_config.TextColumn("Unit"),
+            "vendor": st.column_config.TextColumn("Vendor"),
+            "on_hand": st.column_config.NumberColumn("Current", format="%.2f"),
+            "count": st.column_config.NumberColumn("On Hand", min_value=0.0, step=0.25, format="%.2f"),
+        },
+        num_rows="fixed",
+    )
+    counts_arr[edited.index.to_numpy()] = edited["count"].to_numpy(dtype=np.float64, na_value=0.0)
 
-def area_counter_ui(area_name: str):
-    import math
-    from datetime import datetime
+    if n_pages > 1:
+        pcol, mcol, ncol = st.columns([1,2,1])
+        # Callbacks run before the rerun they trigger, so the new page renders without an extra st.rerun()
+        pcol.button("◀ Prev", disabled=page == 0, key=f"prev_{area_name}",
+                    on_click=_go_to_page, args=(page_key, page - 1))
+        mcol.caption(f"Page {page+1} of {n_pages}")
+        ncol.button("Next ▶", disabled=page >= n_pages-1, key=f"next_{area_name}",
+                    on_click=_go_to_page, args=(page_key, page + 1))
+
+    st.markdown("---")
+    left, right = st.columns([3,2])
+    with left:
+        mask = np.abs(counts_arr - base_arr) > 1e-9
+        st.metric("Adjusted this session", int(np.count_nonzero(mask)))
+        changed_ids, new_vals = df["ingredient_id"].to_numpy()[mask], counts_arr[mask]
+        changes = pd.DataFrame({
+            "Ingredient": df["name"].to_numpy()[mask],
+            "New On Hand": np.round(new_vals, 2),
+            "Delta": np.round(new_vals - base_arr[mask], 2),
+        })
+        if not changes.empty:
+            st.write("Review changes:")
+            st.dataframe(changes, use_container_width=True, hide_index=True)
+        else:
+            st.info("No changes yet.")
 
+    with right:
+        colA, colB = st.columns(2)
+        if colA.button("💾 Save All", use_container_width=True):
+            if changes.empty:
+                st.toast("No change")
+            else:
+                with get_conn() as conn:
+                    n = save_count_adjustments(conn, list(zip(changed_ids.tolist(), new_vals.tolist())))
+                # Full rerun so the page diffs against freshly loaded on-hand; a second click posts nothing
+                load_area_df.clear()
+                st.session_state[f"saved_{area_name}"] = n
+                st.rerun()
+        colB.button("↩️ Reset Session", use_container_width=True,
+                    on_click=_reset_counts, args=(area_name, counts_arr, base_arr))
+
+def area_counter_ui(area_name: str):
     st.title(f"📦 {area_name} — Inventory Count")
 
-    conn = get_conn()
-    df = load_area_df(conn, area_name)
+    df = load_area_df(area_name)
 
     if df.empty:
         st.info(f"No items found for area '{area_name}'. Add items in Settings.")
@@ -66,89 +152,41 @@ def area_counter_ui(area_name: str):
 
     # Search and session state
     search = st.text_input("Search", placeholder=f"Search {area_name}…").strip().lower()
-    filtered = df[df["name"].str.lower().str.contains(search)] if search else df
-
-    if "counts" not in st.session_state:
-        st.session_state["counts"] = {}
-    counts = st.session_state["counts"]
-    for _, row in df.iterrows():
-        counts.setdefault(row.ingredient_id, float(row.on_hand))
-
-    # Sidebar controls
+    filtered = df[df["_name_lc"].str.contains(search, regex=False)
+                  | df["_code_lc"].str.contains(search, regex=False)] if search else df
+
+    # Counts live in a float array aligned with the area's ids (row position == df index);
+    # it is re-seeded from on-hand only when the area's item list changes
+    ids = df["ingredient_id"].to_numpy()
+    base_arr = df["on_hand"].to_numpy(dtype=np.float64)
+    ids_key, counts_key = f"ids_{area_name}", f"counts_arr_{area_name}"
+    if ids_key not in st.session_state or not np.array_equal(st.session_state[ids_key], ids):
+        st.session_state[ids_key] = ids
+        st.session_state[counts_key] = base_arr.copy()
+        _refresh_count_view(area_name)
+    counts_arr = st.session_state[counts_key]
+
+    # Sidebar controls: quick steps apply to one selected item
     default_step = st.sidebar.number_input("Default step", 0.25, 100.0, value=1.0, step=0.25)
     quick_steps = st.sidebar.multiselect("Quick add buttons", [1,5,10,25,50], [1,5,10])
-
-    # KPIs
-    c1, c2, c3 = st.columns(3)
+    if not filtered.empty:
+        name_by_pos = dict(zip(filtered.index, filtered["name"]))
+        pos = st.sidebar.selectbox("Quick step item", list(name_by_pos), format_func=name_by_pos.get)
+        bcols = st.sidebar.columns(len(quick_steps)+2)
+        steps = [(bcols[0], "−", -default_step), (bcols[1], "+", default_step)]
+        steps += [(bcols[i+2], f"+{step}", float(step)) for i, step in enumerate(quick_steps)]
+        for col, label, step in steps:
+            if col.button(label, key=f"step_{label}_{area_name}"):
+                counts_arr[pos] = max(0.0, counts_arr[pos] + step)
+                _refresh_count_view(area_name)
+
+    # KPIs; the adjusted count sits with the review table so it follows each edit
+    c1, c2 = st.columns(2)
     with c1: st.metric("Items", len(filtered))
-    base_map = {r.ingredient_id: float(r.on_hand) for _, r in df.iterrows()}
-    adj_count = sum(1 for rid,v in counts.items() if abs(v - float(base_map.get(rid,0.0))) > 1e-9)
-    with c2: st.metric("Adjusted this session", adj_count)
-    with c3: st.metric("Time", datetime.now().strftime("%-I:%M %p"))
-
-    # Render cards in a grid
-    per_row = 3
-    rows = math.ceil(len(filtered)/per_row) if len(filtered) else 0
-    idx = 0
-    for _ in range(rows):
-        cols = st.columns(per_row)
-        for col in cols:
-            if idx >= len(filtered): break
-            row = filtered.iloc[idx]
-            rid = row.ingredient_id
-            with col:
-                st.markdown("""
-                    <style>
-                    .card {border:1px solid #E3E6EA; border-radius:12px; padding:16px; height:100%; background:#fff;}
-                    .count {font-size: 26px; font-weight:700; margin: 6px 0 0 0;}
-                    .name {font-weight:600; font-size:16px; margin:0;}
-                    .unit {color:#667085; font-size:13px; margin:0;}
-                    </style>
-                """, unsafe_allow_html=True)
-                st.markdown('<div class="card">', unsafe_allow_html=True)
-                st.markdown(f"<p class='name'>{row.name}</p>", unsafe_allow_html=True)
-                st.markdown(f"<p class='unit'>Unit: {row.unit} • Vendor: {row.vendor or '—'}</p>", unsafe_allow_html=True)
-                st.markdown(f"<p class='unit'>Current: {row.on_hand:.2f}</p>", unsafe_allow_html=True)
-                st.markdown(f"<p class='count'>On Hand: {counts.get(rid,0.0):.2f}</p>", unsafe_allow_html=True)
-
-                bcols = st.columns(len(quick_steps)+3)
-                if bcols[0].button("−", key=f"minus_{rid}"):
-                    counts[rid] = max(0.0, counts.get(rid,0.0) - default_step)
-                if bcols[1].button("+", key=f"plus_{rid}"):
-                    counts[rid] = counts.get(rid,0.0) + default_step
-                for i, step in enumerate(quick_steps):
-                    if bcols[i+2].button(f"+{step}", key=f"q{step}_{rid}"):
-                        counts[rid] = counts.get(rid,0.0) + float(step)
-                with bcols[-1]:
-                    val = st.number_input("Set", key=f"set_{rid}", value=float(counts.get(rid,0.0)), step=0.25, label_visibility="collapsed")
-                    if st.button("✔", key=f"ok_{rid}"): counts[rid] = float(val)
-                st.markdown("</div>", unsafe_allow_html=True)
-            idx += 1
-
-    st.session_state["counts"] = counts
-
-    st.markdown("---")
-    left, right = st.columns([3,2])
-    with left:
-        changes = []
-        for rid, new_val in counts.items():
-            base_val = float(base_map.get(rid,0.0))
-            if abs(new_val - base_val) > 1e-9:
-                item = df[df.ingredient_id == rid].iloc[0]
-                changes.append({"Ingredient": item["name"], "New On Hand": round(new_val,2), "Delta": round(new_val - base_val,2)})
-        if changes:
-            st.write("Review changes:")
-            st.dataframe(pd.DataFrame(changes), use_container_width=True, hide_index=True)
-        else:
-            st.info("No changes yet.")
-
-    with right:
-        colA, colB = st.columns(2)
-        if colA.button("💾 Save Counts", use_container_width=True):
-            n = save_count_adjustments(conn, base_map, counts)
-            st.success(f"Saved {n} adjustments.")
-        if colB.button("↩️ Reset Session", use_container_width=True):
-            for _, r in df.iterrows():
-                counts[r.ingredient_id] = float(r.on_hand)
-            st.rerun()
+    with c2: _clock()
 
+    # Grid, review and save rerun on their own when edited (see _count_grid)
+    saved = st.session_state.pop(f"saved_{area_name}", None)
+    if saved is not None:
+        st.success(f"Saved {saved} adjustments.")
+    _count_grid(area_name, df, filtered, search, counts_arr, base_arr)
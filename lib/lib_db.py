@@ -1,5 +1,308 @@
+# lib/lib_db.py
+
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional, List, Tuple
+
+import pandas as pd
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# -------------------------
+# DB Helpers
+# -------------------------
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which PREPARED statements its backend already holds."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def with_sslmode(dsn: str, sslmode: str = "require") -> str:
+    """Add sslmode to a URL or key=value DSN unless it already sets one."""
+    if "sslmode=" in dsn:
+        return dsn
+    if "://" in dsn:
+        return f"{dsn}{'&' if '?' in dsn else '?'}sslmode={sslmode}"
+    return f"{dsn} sslmode={sslmode}"
+
+# run_concurrently fans out up to 4 connections at once (Diagnostics' sections); keeping that many
+# idle means a fan-out reuses warm connections (and their PREPAREs) instead of opening and closing them
+POOL_MIN, POOL_MAX = 4, 10
+
+@st.cache_resource
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """
+    Build the process-wide connection pool once, using, in order of preference:
+    1) st.secrets["DATABASE_URL"] or env DATABASE_URL (full DSN; sslmode=require is added if unset)
+    2) st.secrets["pg"] dict or PG* envs (host/port/db/user/pwd + optional sslmode)
+    On Supabase/Neon prefer a session-level backend (direct, or the pooler in session mode):
+    prepared statements live on the backend and don't survive transaction-mode pooling.
+    """
+    dsn = (st.secrets.get("DATABASE_URL") or os.environ.get("DATABASE_URL"))
+    if dsn:
+        return psycopg2.pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, with_sslmode(dsn), connection_factory=PreparingConnection)
+
+    cfg = st.secrets.get("pg", {})
+    host = cfg.get("host") or os.environ.get("PGHOST", "localhost")
+    port = int(cfg.get("port") or os.environ.get("PGPORT", "5432"))
+    db   = cfg.get("dbname") or os.environ.get("PGDATABASE", "postgres")
+    user = cfg.get("user") or os.environ.get("PGUSER", "postgres")
+    pwd  = cfg.get("password") or os.environ.get("PGPASSWORD", "")
+    sslmode = cfg.get("sslmode") or os.environ.get("PGSSLMODE", "")
+
+    kwargs = dict(host=host, port=port, dbname=db, user=user, password=pwd,
+                  connection_factory=PreparingConnection)
+    if sslmode:
+        kwargs["sslmode"] = sslmode  # e.g., "require" on Supabase/Neon
+    return psycopg2.pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, **kwargs)
 
+@contextmanager
 def get_conn():
-    return psycopg2.connect(st.secrets["DATABASE_URL"])
+    """Borrow a pooled connection; it is rolled back on error and always handed back."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def db_available() -> bool:
+    try:
+        with get_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("select 1;")
+        return True
+    except Exception as e:
+        st.session_state["_db_err"] = str(e)
+        return False
+
+def run_query(sql: str, params: Optional[Tuple]=None) -> Tuple[List[tuple], List[str]]:
+    """Return (rows, column names); rows are plain tuples from the default cursor."""
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql, params or ())
+            if cur.description:
+                return cur.fetchall(), [d.name for d in cur.description]
+            return [], []
+
+def query_df(sql: str, params: Optional[Tuple]=None) -> pd.DataFrame:
+    rows, cols = run_query(sql, params)
+    return pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+
+def df_from_sql(conn, sql: str, params=None, dtype: Optional[dict]=None,
+                cursor_name: Optional[str]=None, itersize: int=2000) -> pd.DataFrame:
+    """
+    Run a SELECT on `conn` and build the DataFrame straight from the tuples.
+    With `cursor_name`, rows stream from a server-side cursor `itersize` at a time instead of
+    being buffered client-side all at once (needs an open transaction, i.e. not autocommit).
+    """
+    with conn.cursor(name=cursor_name) as cur:
+        if cursor_name:
+            cur.itersize = itersize
+        cur.execute(sql, params)
+        # A named cursor only has a description once the first batch is fetched
+        first = cur.fetchmany(itersize) if cursor_name else cur.fetchall()
+        cols = [d.name for d in cur.description]
+        rows = itertools.chain(first, cur) if cursor_name else first
+        df = pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+    return df.astype(dtype) if dtype else df
+
+# Hot reads, PREPAREd once per pooled connection and then run with EXECUTE
+PREPARED = {
+    "q_area": """
+        prepare q_area(text, text) as
+        select i.id, i.name, i.unit, i.vendor, coalesce(o.on_hand, 0) as on_hand
+        from ingredients i
+        left join ingredient_on_hand o on o.ingredient_id = i.id
+        where i.area = $1
+          and ($2 = '' or i.name ilike '%' || $2 || '%'
+                       or coalesce(i.vendor,'') ilike '%' || $2 || '%'
+                       or coalesce(i.short_code,'') ilike '%' || $2 || '%')
+        order by i.name
+    """,
+    "q_planning": """
+        prepare q_planning(text) as
+        select
+          i.id as ingredient_id,
+          i.name,
+          i.unit,
+          i.vendor,
+          i.area,
+          i.weekly_usage,
+          (i.weekly_usage/7.0) as daily_usage,
+          coalesce(i.par, (i.weekly_usage/7.0)*11.0) as par_level,
+          coalesce(oh.on_hand, 0) as current_stock,
+          greatest(0, coalesce(i.par, (i.weekly_usage/7.0)*11.0) - coalesce(oh.on_hand,0)) as to_order,
+          i.cost_per_unit,
+          coalesce(greatest(0, coalesce(i.par, (i.weekly_usage/7.0)*11.0) - coalesce(oh.on_hand,0))
+                   * coalesce(i.cost_per_unit,0), 0) as est_cost
+        from ingredients i
+        left join ingredient_on_hand oh on oh.ingredient_id = i.id
+        where ($1::text is null or i.vendor = $1)
+        order by coalesce(i.vendor,'zzz'), i.name
+    """,
+    "q_vendor_totals": """
+        prepare q_vendor_totals(text) as
+        select
+          i.vendor,
+          sum(coalesce(greatest(0, coalesce(i.par, (i.weekly_usage/7.0)*11.0) - coalesce(oh.on_hand,0))
+                       * coalesce(i.cost_per_unit,0), 0)) as est_cost
+        from ingredients i
+        left join ingredient_on_hand oh on oh.ingredient_id = i.id
+        where ($1::text is null or i.vendor = $1)
+        group by i.vendor
+        order by coalesce(i.vendor,'zzz')
+    """,
+    # Hot write: post absolute counts as adjustments, returning how many rows were inserted
+    "save_counts": """
+        prepare save_counts(text[], numeric[]) as
+        with ins as (
+          insert into inventory_txns (ingredient_id, type, qty, source)
+          select v.rid,
+                 case when v.new_val >= coalesce(o.on_hand,0) then 'in' else 'out' end,
+                 abs(v.new_val - coalesce(o.on_hand,0)),
+                 'adjustment'
+          from unnest($1::uuid[], $2) as v(rid, new_val)
+          left join ingredient_on_hand o on o.ingredient_id = v.rid
+          where v.new_val <> coalesce(o.on_hand,0)
+          returning 1
+        )
+        select count(*) from ins
+    """,
+}
+
+def _prepare(cur, name: str) -> None:
+    """PREPARE `name`; a backend that already holds it (shared through a pooler) is fine as is."""
+    # Behind a transaction-mode pooler another client connection may have prepared it on this
+    # backend; the savepoint keeps that error from aborting the caller's transaction
+    cur.execute("savepoint prepare_stmt")
+    try:
+        cur.execute(PREPARED[name])
+    except psycopg2.errors.DuplicatePreparedStatement:
+        cur.execute("rollback to savepoint prepare_stmt")
+    else:
+        cur.execute("release savepoint prepare_stmt")
+
+def execute_prepared(conn, name: str, params: Tuple=()) -> Tuple[List[tuple], List[str]]:
+    """EXECUTE a PREPARED statement on `conn`, preparing it on first use; the caller owns the transaction."""
+    execute = f"execute {name}({', '.join(['%s'] * len(params))})" if params else f"execute {name}"
+    with conn.cursor() as cur:
+        if name not in conn.prepared:
+            _prepare(cur, name)
+            conn.prepared.add(name)
+        # Roll back only to the savepoint on retry so the caller's earlier statements survive
+        cur.execute("savepoint execute_stmt")
+        try:
+            cur.execute(execute, params or None)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # Backend was swapped under us (e.g. by a pooler): prepare again and retry once
+            cur.execute("rollback to savepoint execute_stmt")
+            _prepare(cur, name)
+            cur.execute(execute, params or None)
+        rows, cols = cur.fetchall(), [d.name for d in cur.description]
+        cur.execute("release savepoint execute_stmt")
+        return rows, cols
+
+def run_prepared(name: str, params: Tuple=()) -> Tuple[List[tuple], List[str]]:
+    """Like run_query, but EXECUTEs a PREPARED statement on a pooled connection."""
+    with get_conn() as conn:
+        return execute_prepared(conn, name, params)
+
+def prepared_df(name: str, params: Tuple=()) -> pd.DataFrame:
+    rows, cols = run_prepared(name, params)
+    return pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+
+def run_concurrently(*calls: Callable):
+    """Run independent DB calls on separate pooled connections at once; results come back in call order."""
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(calls), initializer=add_script_run_ctx, initargs=(None, ctx)) as ex:
+        return [f.result() for f in [ex.submit(call) for call in calls]]
+
+def insert_txn(ingredient_id:str, ttype:str, qty:float, unit_cost:Optional[float], source:str, ref_id:Optional[str]=None):
+    insert_txns([(ingredient_id, ttype, qty, unit_cost, source, ref_id)])
+
+def insert_txns(rows: List[Tuple]):
+    """Insert many (ingredient_id, type, qty, unit_cost, source, ref_id) rows in one round-trip."""
+    if not rows:
+        return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, """
+                insert into inventory_txns (ingredient_id, type, qty, unit_cost, source, ref_id)
+                values %s
+            """, rows, page_size=500)
+        conn.commit()
+
+def post_counts(counts: List[Tuple]) -> int:
+    """Post (ingredient_id, counted) pairs as adjustments; the delta is taken against on-hand at write time."""
+    if not counts:
+        return 0
+    ids, vals = (list(col) for col in zip(*counts))
+    with get_conn() as conn:
+        with conn:
+            rows, _ = execute_prepared(conn, "save_counts", (ids, vals))
+    return rows[0][0]
+
+# -------------------------
+# Data Access
+# -------------------------
+@st.cache_data(ttl=300)
+def distinct_lists() -> Tuple[List[str], List[str]]:
+    """Areas and vendors in one round-trip; shared by both sidebar/filter accessors."""
+    rows, _ = run_query("""
+        select array(select distinct area from ingredients
+                     where area is not null and area <> '' order by area) as areas,
+               array(select distinct vendor from ingredients
+                     where vendor is not null and vendor <> '' order by vendor) as vendors;
+    """)
+    areas, vendors = rows[0]
+    return areas, vendors
+
+def distinct_vendor_list() -> List[str]:
+    return distinct_lists()[1]
+
+def distinct_area_list() -> List[str]:
+    return distinct_lists()[0]
+
+def ingredient_rows_with_onhand(area: str, search: str = "") -> pd.DataFrame:
+    return prepared_df("q_area", (area, search))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def order_planning_df(vendor: Optional[str] = None) -> pd.DataFrame:
+    return prepared_df("q_planning", (vendor,))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def vendor_totals_df(vendor: Optional[str] = None) -> pd.DataFrame:
+    return prepared_df("q_vendor_totals", (vendor,))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def weekly_usage_table() -> pd.DataFrame:
+    return query_df("""
+        select id, name, vendor, area, unit, weekly_usage
+        from ingredients
+        order by coalesce(area,'zzz'), name
+    """)
+
+def save_weekly_usage(updates: pd.DataFrame):
+    rows = [(r["id"], float(r["weekly_usage"] or 0.0)) for _, r in updates.iterrows()]
+    if not rows:
+        return
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            psycopg2.extras.execute_values(cur, """
+                update ingredients set weekly_usage = v.wu::numeric
+                from (values %s) as v(id, wu)
+                where ingredients.id = v.id::uuid
+            """, rows)
+        conn.commit()
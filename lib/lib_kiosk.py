@@ -1,45 +1,46 @@
 import streamlit as st
 import pandas as pd
-from lib.lib_db import get_conn  # we'll create this next
+from lib.lib_db import get_conn, df_from_sql
+
+KIOSK_SQL = """
+select i.id, i.name, i.unit, i.vendor, i.area,
+       coalesce(o.on_hand,0) as on_hand,
+       i.weekly_usage
+from ingredients i
+left join ingredient_on_hand o on o.ingredient_id = i.id
+where (%(area)s is null or i.area = %(area)s)
+order by i.name;
+"""
+KIOSK_DTYPE = {"on_hand": "float64", "weekly_usage": "float64"}
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_kiosk_df(area=None) -> pd.DataFrame:
+    with get_conn() as conn:
+        return df_from_sql(conn, KIOSK_SQL, {"area": area}, dtype=KIOSK_DTYPE)
 
 def render_kiosk(conn=None, area=None, title=None):
     st.set_page_config(page_title=title or "Inventory Kiosk", layout="wide")
     st.title(f"📦 {title or 'Inventory'}")
 
     if conn is None:
-        conn = get_conn()
-
-    query = """
-    with onhand as (
-        select ingredient_id, sum(case when type='in' then qty else -qty end) as on_hand
-        from inventory_txns
-        group by ingredient_id
-    )
-    select i.id, i.name, i.unit, i.vendor, i.area,
-           coalesce(o.on_hand,0) as on_hand,
-           i.weekly_usage
-    from ingredients i
-    left join onhand o on o.ingredient_id = i.id
-    where (%(area)s is null or i.area = %(area)s)
-    order by i.name;
-    """
-
-    df = pd.read_sql(query, conn, params={"area": area})
+        df = load_kiosk_df(area)
+    else:
+        df = df_from_sql(conn, KIOSK_SQL, {"area": area}, dtype=KIOSK_DTYPE)
 
     if df.empty:
         st.info("No items found for this area. Add ingredients in Supabase and set their Area to match this page.")
         return
 
-    for _, row in df.iterrows():
+    for row in df.itertuples(index=False):
         col1, col2, col3 = st.columns([3, 1, 2])
-        col1.markdown(f"**{row['name']}** ({row['unit']})")
-        col2.markdown(f"On hand: {row['on_hand']}")
+        col1.markdown(f"**{row.name}** ({row.unit})")
+        col2.markdown(f"On hand: {row.on_hand}")
         delta = col3.number_input(
-            f"Adjust {row['name']}",
+            f"Adjust {row.name}",
             min_value=-1000,
             max_value=1000,
             value=0,
-            key=row["id"],
+            key=row.id,
             step=1
         )
 
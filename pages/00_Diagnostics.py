@@ -1,7 +1,6 @@
 import os, socket
-import psycopg2
-import pandas as pd
 import streamlit as st
+from lib.lib_db import df_from_sql, get_conn, run_concurrently
 
 st.set_page_config(page_title="Diagnostics", layout="wide")
 st.title("🧪 Diagnostics")
@@ -20,46 +19,54 @@ try:
 except Exception as e:
     st.warning(f"Couldn't parse/resolve host: {e}")
 
-if "sslmode=" not in db_url:
-    db_url = f"{db_url}?sslmode=require"
-
-# 2) Connect and show errors if any
+# 2) Connect through the app's pool (same DSN handling, sslmode=require added if unset) and show errors if any
 try:
-    conn = psycopg2.connect(db_url)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("select 1;")
     st.success("Connected to Supabase/Postgres ✅")
 except Exception as e:
     st.error("❌ Could not connect. Check host (must start with db.), user/password, or SSL.")
     st.exception(e)
     st.stop()
 
-# 3) Show tables present
-try:
-    tables = pd.read_sql("""
+# 3) Tables present and sample rows from key tables
+SECTIONS = [
+    ("Public tables", """
       select table_name
       from information_schema.tables
       where table_schema='public'
-      order by table_name;
-    """, conn)
-    st.subheader("Public tables")
-    st.dataframe(tables, use_container_width=True, hide_index=True)
-except Exception as e:
-    st.error("Failed to list tables")
-    st.exception(e)
+      order by table_name
+    """),
+    ("ingredients (up to 10 rows)", "select * from ingredients limit 10"),
+    ("inventory_txns (up to 10 rows)", "select * from inventory_txns limit 10"),
+    ("Items by Area", """
+      select coalesce(area,'(null)') area, count(*) items
+      from ingredients
+      group by 1 order by 1
+    """),
+]
 
-# 4) Sample rows from key tables
-def show(title, sql):
-    st.subheader(title)
+def fetch(sql):
+    """(frame, None) on success or (None, error), so one failing section doesn't sink the others."""
     try:
-        df = pd.read_sql(sql, conn)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        with get_conn() as conn:
+            return df_from_sql(conn, sql), None
     except Exception as e:
+        return None, e
+
+def show(title, sql, result):
+    st.subheader(title)
+    df, err = result
+    if err is None:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
         st.error(f"Query failed: {sql}")
-        st.exception(e)
+        st.exception(err)
 
-show("ingredients (up to 10 rows)", "select * from ingredients limit 10;")
-show("inventory_txns (up to 10 rows)", "select * from inventory_txns limit 10;")
-show("Items by Area", """
-  select coalesce(area,'(null)') area, count(*) items
-  from ingredients
-  group by 1 order by 1;
-""")
+# Sections are independent, so run them at once, each on its own (warm) pooled connection: the
+# page waits about one round-trip, every frame keeps its native column types and headers (even when
+# empty), and a missing table fails only its own section
+results = run_concurrently(*[lambda sql=sql: fetch(sql) for _, sql in SECTIONS])
+for (title, sql), result in zip(SECTIONS, results):
+    show(title, sql, result)
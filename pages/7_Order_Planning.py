@@ -1,38 +1,42 @@
 import streamlit as st
 import pandas as pd
-from lib.inv_helpers import get_conn
+from lib.inv_helpers import get_conn, df_from_sql
+from lib.lib_db import distinct_vendor_list
 
 st.set_page_config(page_title="Order Planning", layout="wide")
 st.title("🧾 Order Planning")
 
-conn = get_conn()
-
-df = pd.read_sql("""
-  with onhand as (
-    select ingredient_id, sum(case when type='in' then qty else -qty end) as on_hand
-    from inventory_txns group by ingredient_id
-  )
-  select i.id as ingredient_id, i.name, i.unit, i.vendor, i.area,
-         coalesce(i.weekly_usage,0) as weekly_usage,
-         coalesce(o.on_hand,0) as on_hand,
-         coalesce(i.par,0) as par_override,
-         coalesce(i.cost_per_unit,0) as cost_per_unit
-  from ingredients i
-  left join onhand o on o.ingredient_id = i.id
-  order by i.vendor nulls last, i.name;
-""", conn)
-
-df["daily_usage"] = df["weekly_usage"] / 7.0
-# If par_override > 0, use it; else formula (daily_usage * 11)
-df["par_calc"] = (df["daily_usage"] * 11).round(4)
-df["par"] = df.apply(lambda r: r["par_override"] if r["par_override"] and r["par_override"] > 0 else r["par_calc"], axis=1)
-df["to_order"] = (df["par"] - df["on_hand"]).clip(lower=0)
-df["line_total"] = (df["to_order"] * df["cost_per_unit"]).round(2)
-
-vendors = ["All"] + sorted(list(set(df["vendor"].dropna())))
+vendors = ["All"] + distinct_vendor_list()
 vendor = st.selectbox("Vendor", vendors, index=0)
 
-view = df if vendor == "All" else df[df["vendor"] == vendor]
+# float64 throughout: to_order × cost_per_unit must match line_total to the cent
+PLANNING_DTYPE = dict.fromkeys(["daily_usage", "par", "on_hand", "to_order", "cost_per_unit", "line_total"], "float64")
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_planning_df(vendor=None) -> pd.DataFrame:
+    """Planning rows with par (override > 0, else daily × 11), to_order and line_total computed in SQL."""
+    with get_conn() as conn:
+        return df_from_sql(conn, """
+  with p as (
+    select i.name, i.unit, i.vendor, i.area,
+           coalesce(i.weekly_usage,0)/7.0 as daily_usage,
+           case when coalesce(i.par,0) > 0 then i.par
+                else round(coalesce(i.weekly_usage,0)/7.0 * 11, 4) end as par,
+           coalesce(o.on_hand,0) as on_hand,
+           coalesce(i.cost_per_unit,0) as cost_per_unit
+    from ingredients i
+    left join ingredient_on_hand o on o.ingredient_id = i.id
+    where (%(vendor)s::text is null or i.vendor = %(vendor)s)
+  )
+  select vendor, name, unit, area, daily_usage, par, on_hand,
+         greatest(0, par - on_hand) as to_order,
+         cost_per_unit,
+         round(greatest(0, par - on_hand) * cost_per_unit, 2) as line_total
+  from p
+  order by vendor nulls last, name;
+""", {"vendor": vendor}, dtype=PLANNING_DTYPE, cursor_name="planning_cur")
+
+view = load_planning_df(None if vendor == "All" else vendor)
 st.dataframe(
     view[["vendor","name","unit","area","daily_usage","par","on_hand","to_order","cost_per_unit","line_total"]],
     use_container_width=True, hide_index=True
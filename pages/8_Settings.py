@@ -1,17 +1,21 @@
 import streamlit as st
 import pandas as pd
-from lib.inv_helpers import get_conn
+from lib.inv_helpers import get_conn, df_from_sql, run_values
 
 st.set_page_config(page_title="Settings", layout="wide")
 st.title("⚙️ Settings — Vendors, Areas, Usage")
 
-conn = get_conn()
-df = pd.read_sql("""
+@st.cache_data(ttl=30, show_spinner=False)
+def load_settings_df() -> pd.DataFrame:
+    with get_conn() as conn:
+        return df_from_sql(conn, """
   select id, name, unit, vendor, area,
-         coalesce(weekly_usage,0) as weekly_usage,
+         coalesce(weekly_usage,0) as weekly_usage
   from ingredients
   order by name;
-""", conn)
+""")
+
+df = load_settings_df()
 
 st.caption("Edit fields and click **Save Changes**. Current formula = weekly/7 × 11.")
 
@@ -29,20 +33,24 @@ edited = st.data_editor(
 )
 
 if st.button("💾 Save Changes", type="primary"):
-    # Compare and write diffs
-    changes = 0
-    with conn, conn.cursor() as cur:
-        for _, row in edited.iterrows():
-            cur.execute("""
-              update ingredients
-                 set vendor = %s,
-                     area = %s,
-                     weekly_usage = %s,
-               where id = %s
-            """, (row["vendor"] or None,
-                  row["area"] or None,
-                  float(row["weekly_usage"] or 0),
-                  row["id"]))
-            changes += 1
-    st.success(f"Saved {changes} rows.")
-
+    # Only rows whose editable fields differ from what was loaded are written
+    blanks = {"vendor": "", "area": "", "weekly_usage": 0}
+    cols = list(blanks)
+    changed = edited[(edited[cols].fillna(blanks) != df[cols].fillna(blanks)).any(axis=1)]
+    rows = [(rid, vendor or None, area or None, float(wu or 0))
+            for rid, vendor, area, wu in changed[["id"] + cols].itertuples(index=False, name=None)]
+    if not rows:
+        st.info("No changes to save.")
+        st.stop()
+    with get_conn() as conn:
+        n = run_values(conn, """
+          update ingredients as t
+             set vendor = v.vendor,
+                 area = v.area,
+                 weekly_usage = v.weekly_usage
+            from (values %s) as v(id, vendor, area, weekly_usage)
+           where t.id = v.id
+        """, rows, template="(%s::uuid, %s, %s, %s::numeric)")
+    # Vendor/area/usage feed every cached list and frame (area loaders, planning, this page)
+    st.cache_data.clear()
+    st.success(f"Saved {n} rows.")
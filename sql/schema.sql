@@ -1 +1,47 @@
+-- Lets the on-hand aggregate (sum of +/-qty per ingredient) run as an index-only scan.
+-- On a live table, build it with `create index concurrently` and follow with `vacuum analyze inventory_txns`.
+create index if not exists inventory_txns_onhand_covering
+    on inventory_txns (ingredient_id) include (type, qty);
 
+-- Every area page and kiosk loads one area's ingredients (`where i.area = %s`).
+create index if not exists idx_ingredients_area on ingredients (area);
+
+-- On-hand per ingredient, kept current by a trigger on inventory_txns so reads are a
+-- primary-key lookup instead of re-summing the whole transaction history.
+drop materialized view if exists mv_onhand;
+
+create table if not exists ingredient_on_hand (
+    ingredient_id uuid primary key,
+    on_hand numeric not null default 0
+);
+
+create or replace function apply_txn_to_on_hand() returns trigger
+language plpgsql as $$
+begin
+    -- Back out the old row (update/delete), then apply the new one (insert/update)
+    if tg_op in ('UPDATE', 'DELETE') then
+        update ingredient_on_hand
+        set on_hand = on_hand - case when old.type='in' then old.qty else -old.qty end
+        where ingredient_id = old.ingredient_id;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into ingredient_on_hand (ingredient_id, on_hand)
+        values (new.ingredient_id, case when new.type='in' then new.qty else -new.qty end)
+        on conflict (ingredient_id) do update
+            set on_hand = ingredient_on_hand.on_hand + excluded.on_hand;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists inventory_txns_on_hand on inventory_txns;
+create trigger inventory_txns_on_hand
+    after insert or update or delete on inventory_txns
+    for each row execute function apply_txn_to_on_hand();
+
+-- Backfill (or resync) from the existing history
+insert into ingredient_on_hand (ingredient_id, on_hand)
+select ingredient_id, sum(case when type='in' then qty else -qty end)
+from inventory_txns
+group by ingredient_id
+on conflict (ingredient_id) do update set on_hand = excluded.on_hand;